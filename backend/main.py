@@ -1,67 +1,75 @@
 import asyncio
+import base64
 import hashlib
+import logging
 import os
 import secrets
-import uuid
-from datetime import datetime, timedelta, timezone
-
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Annotated
+
+import anyio
 from dotenv import load_dotenv
 from fastapi import Cookie, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel, Field, field_validator
-from pymongo import ASCENDING, MongoClient
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, StringConstraints
+from pymongo import ASCENDING, AsyncMongoClient, ReturnDocument
 from pymongo.errors import DuplicateKeyError
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from starlette.types import ASGIApp, Receive, Scope, Send
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGODB_URI = os.getenv("MONGODB")
 MONGODB_DB = os.getenv("MONGODB_DB", "applyo_poll_db")
+REDIS_URL = os.getenv("REDIS_URL")
+SSE_KEEPALIVE_SECONDS = 15
+SSE_PREFIX = b"data: "
+SSE_SUFFIX = b"\n\n"
+SSE_KEEPALIVE = b": keepalive\n\n"
+REDIS_CLEANUP_TIMEOUT_SECONDS = 5
+REDIS_RETRY_SECONDS = 1
 IP_HASH_SALT = os.getenv("IP_HASH_SALT", "change-me-in-production")
+IP_HASH_KEY = hashlib.blake2b(IP_HASH_SALT.encode("utf-8"), digest_size=32).digest()
 RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", "60"))
 RATE_LIMIT_MAX_ATTEMPTS = int(os.getenv("RATE_LIMIT_MAX_ATTEMPTS", "15"))
+RATE_LIMIT_MAX_BUCKETS = 100_000
+RATE_LIMIT_MAX_INFLIGHT = int(os.getenv("RATE_LIMIT_MAX_INFLIGHT", "4"))
+OPTION_ID_BYTES = 8
+POLL_PROJECTION = {"_id": 1, "question": 1, "version": 1, "created_at": 1, "updated_at": 1, "total_votes": 1, "options": 1}
 
 origins = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000,https://applyo-skite-internship-task.vercel.app")
-allow_origins = [item.strip() for item in origins.split(",") if item.strip()]
-
-app = FastAPI(title="Simple Poll API", version="1.1.0")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allow_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-poll_events: dict[str, asyncio.Event] = {}
-mongo_client: MongoClient | None = None
+# Starlette types allow_origins as Sequence[str] but only checks `origin in self.allow_origins`, so a set works.
+allow_origins = frozenset(item.strip() for item in origins.split(",") if item.strip())
+
+poll_events: dict[str, set[asyncio.Event]] = {}
+rate_buckets: dict[str, deque[float]] = {}
+rate_gc_task: asyncio.Task | None = None
+redis_relay_task: asyncio.Task | None = None
+inflight_votes: dict[str, int] = {}
+mongo_client: AsyncMongoClient | None = None
 db = None
+redis_client: Redis | None = None
 
 
 class CreatePollRequest(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True, extra="forbid")
+
     question: str = Field(min_length=1, max_length=500)
-    options: list[str]
-
-    @field_validator("question")
-    @classmethod
-    def validate_question(cls, value: str) -> str:
-        text = value.strip()
-        if not text:
-            raise ValueError("question cannot be empty")
-        return text
-
-    @field_validator("options")
-    @classmethod
-    def validate_options(cls, value: list[str]) -> list[str]:
-        cleaned = [item.strip() for item in value if item.strip()]
-        if len(cleaned) < 2:
-            raise ValueError("at least 2 non-empty options are required")
-        if len(cleaned) > 20:
-            raise ValueError("maximum 20 options allowed")
-        return cleaned
+    options: list[Annotated[str, StringConstraints(strip_whitespace=True, min_length=1)]] = Field(min_length=2, max_length=20)
 
 
 class VoteRequest(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
     option_id: str = Field(min_length=1)
 
 
@@ -73,19 +81,46 @@ def now_iso() -> str:
     return now_utc().isoformat()
 
 
-def get_client_ip(request: Request) -> str:
-    forwarded_for = request.headers.get("x-forwarded-for", "")
-    if forwarded_for:
-        first = forwarded_for.split(",")[0].strip()
-        if first:
-            return first
-    if request.client and request.client.host:
-        return request.client.host
+def get_client_ip(scope: Scope) -> str:
+    for name, value in scope["headers"]:
+        if name == b"x-forwarded-for":
+            first = value.decode("latin-1").split(",")[0].strip()
+            if first:
+                return first
+            break
+    client = scope.get("client")
+    if client and client[0]:
+        return client[0]
     return "unknown"
 
 
+@lru_cache(maxsize=8192)
 def hash_ip(ip: str) -> str:
-    return hashlib.sha256(f"{IP_HASH_SALT}:{ip}".encode("utf-8")).hexdigest()
+    return hashlib.blake2b(ip.encode("utf-8"), key=IP_HASH_KEY, digest_size=16).hexdigest()
+
+
+class ClientIPMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            client_ip = get_client_ip(scope)
+            state = scope.setdefault("state", {})
+            state["client_ip"] = client_ip
+            state["ip_hash"] = hash_ip(client_ip)
+        await self.app(scope, receive, send)
+
+
+app = FastAPI(title="Simple Poll API", version="1.1.0", default_response_class=ORJSONResponse)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=allow_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(ClientIPMiddleware)
 
 
 def serialize_poll(poll_doc: dict | None) -> dict:
@@ -102,19 +137,92 @@ def serialize_poll(poll_doc: dict | None) -> dict:
     }
 
 
-def upsert_poll_event(poll_id: str) -> asyncio.Event:
-    if poll_id not in poll_events:
-        poll_events[poll_id] = asyncio.Event()
-    return poll_events[poll_id]
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def check_rate_limit(ip_digest: str) -> None:
+    now = time.monotonic()
+    bucket = rate_buckets.get(ip_digest)
+    if bucket is None:
+        if len(rate_buckets) >= RATE_LIMIT_MAX_BUCKETS:
+            del rate_buckets[next(iter(rate_buckets))]
+        bucket = rate_buckets[ip_digest] = deque()
+    while bucket and bucket[0] < now - RATE_LIMIT_WINDOW_SECONDS:
+        bucket.popleft()
+    if len(bucket) >= RATE_LIMIT_MAX_ATTEMPTS:
+        raise HTTPException(status_code=429, detail="Too many vote attempts. Try again later.")
+    bucket.append(now)
 
 
-def notify_poll_change(poll_id: str) -> None:
-    upsert_poll_event(poll_id).set()
+async def prune_rate_buckets() -> None:
+    while True:
+        await asyncio.sleep(RATE_LIMIT_WINDOW_SECONDS)
+        cutoff = time.monotonic() - RATE_LIMIT_WINDOW_SECONDS
+        for key in [key for key, bucket in rate_buckets.items() if not bucket or bucket[-1] < cutoff]:
+            del rate_buckets[key]
 
 
-def get_poll_or_404(poll_id: str) -> dict:
+@contextmanager
+def vote_slot(ip_digest: str) -> Iterator[None]:
+    current = inflight_votes.get(ip_digest, 0)
+    if current >= RATE_LIMIT_MAX_INFLIGHT:
+        raise HTTPException(status_code=429, detail="Too many concurrent votes. Try again shortly.")
+    inflight_votes[ip_digest] = current + 1
+    try:
+        yield
+    finally:
+        remaining = inflight_votes[ip_digest] - 1
+        if remaining:
+            inflight_votes[ip_digest] = remaining
+        else:
+            del inflight_votes[ip_digest]
+
+
+def poll_channel(poll_id: str) -> str:
+    return f"poll:{poll_id}"
+
+
+def wake_poll_subscribers(poll_id: str) -> None:
+    for event in poll_events.get(poll_id, ()):
+        event.set()
+
+
+async def relay_redis_notifications(client: Redis) -> None:
+    while True:
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(poll_channel("*"))
+            async for message in pubsub.listen():
+                if message["type"] == "pmessage":
+                    wake_poll_subscribers(message["channel"].removeprefix(poll_channel("")))
+        except RedisError:
+            logger.exception("Redis poll notification relay failed; reconnecting")
+        finally:
+            with anyio.move_on_after(REDIS_CLEANUP_TIMEOUT_SECONDS, shield=True):
+                await pubsub.aclose()
+        await asyncio.sleep(REDIS_RETRY_SECONDS)
+
+
+async def notify_poll_change(poll_id: str) -> None:
+    if redis_client is not None:
+        try:
+            await redis_client.publish(poll_channel(poll_id), now_iso())
+            return
+        except RedisError:
+            logger.exception("Failed to publish change for poll %s", poll_id)
+    wake_poll_subscribers(poll_id)
+
+
+async def get_poll_or_404(poll_id: str) -> dict:
     assert db is not None
-    poll_doc = db.polls.find_one({"_id": poll_id}, {"_id": 1, "question": 1, "version": 1, "created_at": 1, "updated_at": 1, "total_votes": 1, "options": 1})
+    poll_doc = await db.polls.find_one({"_id": poll_id}, POLL_PROJECTION)
     if not poll_doc:
         raise HTTPException(status_code=404, detail="Poll not found")
     return poll_doc
@@ -122,24 +230,35 @@ def get_poll_or_404(poll_id: str) -> dict:
 
 @app.on_event("startup")
 async def startup() -> None:
-    global mongo_client, db
+    global mongo_client, db, redis_client, rate_gc_task, redis_relay_task
     if not MONGODB_URI:
         raise RuntimeError("MONGODB is not set in environment.")
-    mongo_client = MongoClient(MONGODB_URI)
+    mongo_client = AsyncMongoClient(MONGODB_URI, maxPoolSize=100)
     db = mongo_client[MONGODB_DB]
-    db.command("ping")
+    await db.command("ping")
+
+    await db.votes.create_index([("poll_id", ASCENDING), ("voter_id", ASCENDING)], unique=True)
+    await db.votes.create_index([("poll_id", ASCENDING)])
 
-    db.polls.create_index([("updated_at", ASCENDING)])
-    db.votes.create_index([("poll_id", ASCENDING), ("voter_id", ASCENDING)], unique=True)
-    db.votes.create_index([("poll_id", ASCENDING)])
-    db.vote_attempts.create_index([("poll_id", ASCENDING), ("ip_hash", ASCENDING), ("attempted_at", ASCENDING)])
+    if REDIS_URL:
+        redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
+        await redis_client.ping()
+        redis_relay_task = asyncio.create_task(relay_redis_notifications(redis_client))
+
+    rate_gc_task = asyncio.create_task(prune_rate_buckets())
 
 
 @app.on_event("shutdown")
 async def shutdown() -> None:
     global mongo_client
+    if rate_gc_task is not None:
+        rate_gc_task.cancel()
+    if redis_relay_task is not None:
+        redis_relay_task.cancel()
+    if redis_client is not None:
+        await redis_client.aclose()
     if mongo_client is not None:
-        mongo_client.close()
+        await mongo_client.close()
 
 
 @app.get("/")
@@ -152,7 +271,15 @@ async def create_poll(payload: CreatePollRequest) -> dict:
     assert db is not None
     poll_id = secrets.token_urlsafe(6)
     created_at = now_utc()
-    options = [{"id": secrets.token_urlsafe(8), "text": text, "votes": 0} for text in payload.options]
+    raw = secrets.token_bytes(OPTION_ID_BYTES * len(payload.options))
+    options = [
+        {
+            "id": base64.urlsafe_b64encode(raw[i * OPTION_ID_BYTES : (i + 1) * OPTION_ID_BYTES]).rstrip(b"=").decode("ascii"),
+            "text": text,
+            "votes": 0,
+        }
+        for i, text in enumerate(payload.options)
+    ]
 
     poll_doc = {
         "_id": poll_id,
@@ -163,17 +290,22 @@ async def create_poll(payload: CreatePollRequest) -> dict:
         "total_votes": 0,
         "options": options,
     }
-    db.polls.insert_one(poll_doc)
+    await db.polls.insert_one(poll_doc)
 
     data = serialize_poll(poll_doc)
     data["share_path"] = f"/?poll={poll_id}"
-    notify_poll_change(poll_id)
+    await notify_poll_change(poll_id)
     return data
 
 
-@app.get("/polls/{poll_id}")
-async def get_poll(poll_id: str) -> dict:
-    return serialize_poll(get_poll_or_404(poll_id))
+@app.get("/polls/{poll_id}", response_model=None)
+async def get_poll(poll_id: str, request: Request, response: Response) -> dict | Response:
+    poll_doc = await get_poll_or_404(poll_id)
+    etag = f'"{poll_doc["version"]}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return serialize_poll(poll_doc)
 
 
 @app.post("/polls/{poll_id}/vote")
@@ -185,52 +317,43 @@ async def vote_poll(
     voter_id: str | None = Cookie(default=None),
 ) -> dict:
     assert db is not None
-    current_voter_id = voter_id or str(uuid.uuid4())
-    ip_digest = hash_ip(get_client_ip(request))
+    current_voter_id = voter_id or secrets.token_urlsafe(16)
+    ip_digest = request.state.ip_hash
     created_at = now_utc()
-    window_start = created_at - timedelta(seconds=RATE_LIMIT_WINDOW_SECONDS)
-
-    poll_match = db.polls.find_one({"_id": poll_id, "options.id": payload.option_id}, {"_id": 1})
-    if not poll_match:
-        existing = db.polls.find_one({"_id": poll_id}, {"_id": 1})
-        if not existing:
-            raise HTTPException(status_code=404, detail="Poll not found")
-        raise HTTPException(status_code=400, detail="Option not found for this poll")
-
-    db.vote_attempts.insert_one(
-        {"poll_id": poll_id, "ip_hash": ip_digest, "attempted_at": created_at}
-    )
-    attempts = db.vote_attempts.count_documents(
-        {"poll_id": poll_id, "ip_hash": ip_digest, "attempted_at": {"$gte": window_start}}
-    )
-    if attempts > RATE_LIMIT_MAX_ATTEMPTS:
-        raise HTTPException(status_code=429, detail="Too many vote attempts. Try again later.")
-
-    try:
-        db.votes.insert_one(
+    check_rate_limit(ip_digest)
+
+    with vote_slot(ip_digest):
+        try:
+            await db.votes.insert_one(
+                {
+                    "poll_id": poll_id,
+                    "option_id": payload.option_id,
+                    "voter_id": current_voter_id,
+                    "ip_hash": ip_digest,
+                    "created_at": created_at,
+                }
+            )
+        except DuplicateKeyError as exc:
+            raise HTTPException(status_code=409, detail="You already voted on this poll") from exc
+
+        updated_poll = await db.polls.find_one_and_update(
+            {"_id": poll_id, "options.id": payload.option_id},
             {
-                "poll_id": poll_id,
-                "option_id": payload.option_id,
-                "voter_id": current_voter_id,
-                "ip_hash": ip_digest,
-                "created_at": created_at,
-            }
+                "$inc": {"options.$.votes": 1, "version": 1, "total_votes": 1},
+                "$set": {"updated_at": created_at},
+            },
+            projection=POLL_PROJECTION,
+            return_document=ReturnDocument.AFTER,
         )
-    except DuplicateKeyError as exc:
-        raise HTTPException(status_code=409, detail="You already voted on this poll") from exc
+        if not updated_poll:
+            await db.votes.delete_one({"poll_id": poll_id, "voter_id": current_voter_id})
+            existing = await db.polls.find_one({"_id": poll_id}, {"_id": 1})
+            if not existing:
+                raise HTTPException(status_code=404, detail="Poll not found")
+            raise HTTPException(status_code=400, detail="Option not found for this poll")
 
-    update_result = db.polls.update_one(
-        {"_id": poll_id, "options.id": payload.option_id},
-        {
-            "$inc": {"options.$.votes": 1, "version": 1, "total_votes": 1},
-            "$set": {"updated_at": created_at},
-        },
-    )
-    if update_result.matched_count == 0:
-        raise HTTPException(status_code=400, detail="Option not found for this poll")
+        await notify_poll_change(poll_id)
 
-    updated_poll = get_poll_or_404(poll_id)
-    notify_poll_change(poll_id)
     response.set_cookie(
         key="voter_id",
         value=current_voter_id,
@@ -243,12 +366,29 @@ async def vote_poll(
 
 @app.get("/polls/{poll_id}/events")
 async def poll_events_stream(poll_id: str) -> StreamingResponse:
-    event = upsert_poll_event(poll_id)
+    return StreamingResponse(poll_event_generator(poll_id), media_type="text/event-stream")
+
+
+def sse_data(payload: str) -> bytes:
+    return SSE_PREFIX + payload.encode("ascii") + SSE_SUFFIX
 
-    async def event_generator():
+
+async def poll_event_generator(poll_id: str):
+    event = asyncio.Event()
+    poll_events.setdefault(poll_id, set()).add(event)
+    try:
         while True:
-            await event.wait()
+            try:
+                await asyncio.wait_for(event.wait(), timeout=SSE_KEEPALIVE_SECONDS)
+            except TimeoutError:
+                yield SSE_KEEPALIVE
+                continue
             event.clear()
-            yield f"data: {now_iso()}\n\n"
+            yield sse_data(now_iso())
+    finally:
+        subscribers = poll_events.get(poll_id)
+        if subscribers is not None:
+            subscribers.discard(event)
+            if not subscribers:
+                del poll_events[poll_id]
 
-    return StreamingResponse(event_generator(), media_type="text/event-stream")
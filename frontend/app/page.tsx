@@ -62,7 +62,7 @@ function PollPage() {
       try {
         const response = await fetch(`${API_BASE}/polls/${pollId}`, {
           credentials: "include",
-          cache: "no-store",
+          cache: "no-cache",
         });
 
         if (!response.ok) {